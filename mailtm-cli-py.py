@@ -9,36 +9,143 @@ import os
 import time
 import json
 import re
+import functools
+import io
+import base64
+import binascii
 import random
 import string
-from typing import Any, Dict, List
-from html import unescape
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+from html.parser import HTMLParser
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except ImportError:
     print("This script requires the 'requests' package. Install with:\n  pip install requests")
     sys.exit(1)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 API_BASE = "https://api.mail.tm"
+_JSON_CTYPES = ("application/json", "application/ld+json")
+POOL_MAXSIZE = 32
+# Caps concurrent downloads, not request rate: small attachments can exceed the
+# API's 8 QPS per IP, in which case the adapter's 429 retry/backoff paces them
+DOWNLOAD_WORKERS = min(8, POOL_MAXSIZE)
+STREAM_CHUNK = 64 * 1024
+DOMAINS_TTL = 300
+TOKEN_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "mailtm-cli",
+    "tokens.json",
+)
+# Treat tokens this close to expiry as stale
+TOKEN_EXP_MARGIN = 60
+# Account fields shown by print_account_info; a /token reply only stands in for /me
+# when it carries all of them
+ACCOUNT_FIELDS = frozenset({"id", "address", "used", "quota", "isDisabled", "isDeleted"})
+# Message fields shown by print_list; list_messages_lite keeps only these
+LIST_FIELDS = frozenset({"id", "createdAt", "subject", "intro", "seen", "from"})
+_LOCAL_ALPHABET = string.ascii_lowercase + string.digits
 
 
 # --------------------------
 # Helpers
 # --------------------------
 
+def _loads(raw):
+    # orjson is optional; it parses bytes directly and is much faster on large inboxes
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+@functools.lru_cache(maxsize=None)
+def _re_trail_ws():
+    # Compiled on first use so commands that never render HTML skip it
+    return re.compile(r"[ \t]+\n")
+
+
+@functools.lru_cache(maxsize=None)
+def _re_blanks():
+    return re.compile(r"\n{3,}")
+
+
+class _HTMLSimplifier(HTMLParser):
+    SKIP_TAGS = {"script", "style"}
+    BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "li", "tr", "table", "ul", "ol"}
+
+    def __init__(self):
+        # convert_charrefs decodes entities in text only, so "&lt;b&gt;" stays literal
+        super().__init__(convert_charrefs=True)
+        self.in_skip = 0
+        self.out = []
+        # Text inside script/style, kept in case the skip tag is never closed
+        self.skipped = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.in_skip += 1
+        elif tag == "br":
+            self.out.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "br":
+            self.out.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            if self.in_skip:
+                self.in_skip -= 1
+                if not self.in_skip:
+                    self.skipped = []
+        elif tag in self.BLOCK_TAGS:
+            self.out.append("\n")
+
+    def handle_data(self, data):
+        if self.in_skip:
+            self.skipped.append(data)
+        else:
+            self.out.append(data)
+
+    def simplify(self, html: str) -> str:
+        text = _re_trail_ws().sub("\n", self._extract(html))
+        return _re_blanks().sub("\n\n", text).strip()
+
+    def _extract(self, html: str) -> str:
+        self.feed(html)
+        self.close()
+        if self.in_skip:
+            # An unterminated <script>/<style> would otherwise swallow the rest of the
+            # document. Like the old regex pipeline, keep what follows it as markup:
+            # re-parse the buffered text plus any tail older parsers leave in rawdata
+            tail = "".join(self.skipped) + self.rawdata
+            self.out.append(_HTMLSimplifier()._extract(tail))
+        return "".join(self.out)
+
+
 def _simplify_html(html_parts):
     if not html_parts:
         return ""
     html = "\n\n".join([part for part in html_parts if isinstance(part, str)])
-    html = unescape(html)
-    html = re.sub(r"(?is)<(script|style).*?>.*?</\1>", "", html)
-    html = re.sub(r"(?i)<br\s*/?>", "\n", html)
-    html = re.sub(r"(?i)</(p|div|h\d|li|tr|table|ul|ol)>", "\n", html)
-    html = re.sub(r"(?s)<.*?>", "", html)
-    html = re.sub(r"[ \t]+\n", "\n", html)
-    html = re.sub(r"\n{3,}", "\n\n", html)
-    return html.strip()
+    return _HTMLSimplifier().simplify(html)
 
 
 def _normalize_collection(coll: Any) -> Dict[str, Any]:
@@ -48,41 +155,180 @@ def _normalize_collection(coll: Any) -> Dict[str, Any]:
 
 
 def _format_address(addr: Any) -> str:
-    if isinstance(addr, dict):
-        name = addr.get("name") or ""
-        email = addr.get("address") or ""
-        if name and email:
-            return f"{name} <{email}>"
-        return email or name
-    if isinstance(addr, str):
+    # Exact type checks: API payloads only ever hold plain dicts and strs
+    t = type(addr)
+    if t is str:
         return addr
+    if t is dict:
+        name = addr.get("name")
+        email = addr.get("address")
+        return f"{name} <{email}>" if name and email else (email or name or "")
     return ""
 
 
 def _format_address_list(addrs: Any) -> str:
-    if addrs is None:
-        return ""
-    if isinstance(addrs, dict):
-        addrs = [addrs]
-    if isinstance(addrs, str):
-        addrs = [addrs]
-    if isinstance(addrs, list):
-        parts = []
-        for a in addrs:
-            s = _format_address(a)
-            if s:
-                parts.append(s)
-        return ", ".join(parts)
+    t = type(addrs)
+    if t is list:
+        if all(type(a) is str for a in addrs):
+            return ", ".join(filter(None, addrs))
+        return ", ".join([s for s in map(_format_address, addrs) if s])
+    if t is dict or t is str:
+        return _format_address(addrs)
     return ""
 
 
+def _jwt_claims(token: str) -> Dict[str, Any]:
+    # Unverified decode of the JWT payload; the server still authorizes every call
+    try:
+        seg = token.split(".")[1]
+        seg += "=" * (-len(seg) % 4)
+        claims = _loads(base64.urlsafe_b64decode(seg))
+    except Exception:
+        return {}
+    return claims if isinstance(claims, dict) else {}
+
+
+def _read_token_cache() -> Dict[str, Any]:
+    try:
+        with open(TOKEN_CACHE, "rb") as f:
+            data = _loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_token_cache(data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(TOKEN_CACHE), mode=0o700, exist_ok=True)
+    tmp = f"{TOKEN_CACHE}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(_dumps(data))
+    os.replace(tmp, TOKEN_CACHE)
+
+
+def _load_token(email: str) -> Optional[str]:
+    entry = _read_token_cache().get(email)
+    if not isinstance(entry, dict):
+        return None
+    exp = entry.get("exp")
+    if not isinstance(exp, (int, float)) or exp - TOKEN_EXP_MARGIN <= time.time():
+        return None
+    return entry.get("token")
+
+
+def _save_token(email: str, token: str) -> None:
+    exp = _jwt_claims(token).get("exp")
+    if not isinstance(exp, (int, float)):
+        return
+    data = _read_token_cache()
+    data[email] = {"token": token, "exp": exp}
+    try:
+        _write_token_cache(data)
+    except OSError:
+        pass
+
+
+def _drop_token(email: str) -> None:
+    data = _read_token_cache()
+    if data.pop(email, None) is not None:
+        try:
+            _write_token_cache(data)
+        except OSError:
+            pass
+
+
+def _created_key(m: Dict[str, Any]) -> str:
+    return m.get("createdAt") or ""
+
+
+def _decode_source(payload: str) -> bytes:
+    # Base64 payloads (possibly line-wrapped) decode to the raw RFC 5322 bytes; a
+    # plain-text source still has header colons and fails strict validation, so it
+    # is kept as text
+    try:
+        return base64.b64decode("".join(payload.split()), validate=True)
+    except binascii.Error:
+        return payload.encode("utf-8", errors="ignore")
+
+
+def _dedupe_filenames(names: List[str]) -> List[str]:
+    # Repeated names get _1, _2, ... suffixes so parallel downloads never share a path;
+    # compared case-insensitively for macOS/Windows filesystems
+    taken = set()
+    out = []
+    for name in names:
+        root, ext = os.path.splitext(name)
+        candidate = name
+        n = 0
+        while candidate.casefold() in taken:
+            n += 1
+            candidate = f"{root}_{n}{ext}"
+        taken.add(candidate.casefold())
+        out.append(candidate)
+    return out
+
+
+def _write_file_atomic(path: str, write) -> None:
+    # Streams via `write(fp)` into path + ".part" and renames it into place only on
+    # success, so a failed download never truncates or leaves a partial file at path
+    part = f"{path}.part"
+    try:
+        with open(part, "wb") as f:
+            write(f)
+        os.replace(part, path)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+
+
+def _project_collection(events, fields) -> Dict[str, Any]:
+    # Rebuilds a hydra collection from ijson events, materializing only `fields`
+    # of each member so unused payload is never turned into Python objects.
+    # A bare top-level array (see _normalize_collection) is accepted as well.
+    item_prefix = "hydra:member.item"
+    first = True
+    members: List[Dict[str, Any]] = []
+    total = None
+    item = None
+    key = None
+    builder = None
+    for prefix, event, value in events:
+        if first:
+            first = False
+            if event == "start_array":
+                item_prefix = "item"
+        if prefix == item_prefix:
+            if builder is not None:
+                item[key] = builder.value
+                builder = None
+            if event == "start_map":
+                item = {}
+            elif event == "map_key":
+                key = value
+                builder = ijson.ObjectBuilder() if value in fields else None
+            elif event == "end_map":
+                members.append(item)
+        elif builder is not None and prefix.startswith(item_prefix + "."):
+            builder.event(event, value)
+        elif prefix == "hydra:totalItems":
+            total = value
+    return {"hydra:member": members, "hydra:totalItems": len(members) if total is None else total}
+
+
 def _sort_desc_by_created(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    return sorted(items, key=lambda m: (m.get("createdAt") or ""), reverse=True)
+    return sorted(items, key=_created_key, reverse=True)
+
+
+def _latest_by_created(items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # Single pass; `latest` only needs the newest item, not a sorted page
+    return max(items, key=_created_key, default=None)
 
 
 def _rand_local_part(n=10) -> str:
-    alphabet = string.ascii_lowercase + string.digits
-    return "".join(random.choice(alphabet) for _ in range(n))
+    return "".join(random.choices(_LOCAL_ALPHABET, k=n))
 
 
 # --------------------------
@@ -93,47 +339,62 @@ class MailTMClient:
     def __init__(self, timeout: int = 20):
         self.timeout = timeout
         self._token = None
+        self._domains_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._me_cache: Optional[Dict[str, Any]] = None
+        self._account_id: Optional[str] = None
         self._session = requests.Session()
         self._session.headers.update({
             "Accept": "application/ld+json, application/json;q=0.9",
             "User-Agent": "mailtm-client/2.0 (+https://mail.tm)"
         })
+        # Retry transient failures inside urllib3 so pooled TLS connections are reused;
+        # raise_on_status=False lets _request report the final HTTP error as usual
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST", "PATCH", "DELETE"}),
+            raise_on_status=False,
+        )
+        self._session.mount(API_BASE, HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry))
 
     def _url(self, path: str) -> str:
         return f"{API_BASE}{path}"
 
-    def _auth_headers(self) -> dict:
+    def _require_auth(self) -> None:
+        # The bearer token lives on the session headers once login() succeeds
         if not self._token:
             raise RuntimeError("Not authenticated. Call login() first.")
-        return {"Authorization": f"Bearer {self._token}"}
 
     def _request(self, method: str, path: str, auth: bool = False, **kwargs):
         if "timeout" not in kwargs:
             kwargs["timeout"] = self.timeout
         url = self._url(path)
         if auth:
-            hdrs = kwargs.pop("headers", {})
-            hdrs.update(self._auth_headers())
-            kwargs["headers"] = hdrs
+            self._require_auth()
         resp = self._session.request(method.upper(), url, **kwargs)
         if not resp.ok:
-            msg = f"{method} {path} -> HTTP {resp.status_code}"
-            try:
-                data = resp.json()
-                msg += f" | {json.dumps(data, ensure_ascii=False)}"
-            except Exception:
-                msg += f" | {resp.text[:300]}"
-            raise requests.HTTPError(msg, response=resp)
+            raise self._http_error(method, path, resp)
         if resp.status_code == 204:
             return None
         ctype = resp.headers.get("Content-Type", "")
-        if "application/json" in ctype or "application/ld+json" in ctype:
+        if ctype.startswith(_JSON_CTYPES):
             try:
-                return resp.json()
+                return _loads(resp.content)
             except Exception:
                 return resp.text
         return resp.text
 
+    @staticmethod
+    def _http_error(method: str, path: str, resp) -> "requests.HTTPError":
+        msg = f"{method} {path} -> HTTP {resp.status_code}"
+        try:
+            data = _loads(resp.content)
+            msg += f" | {json.dumps(data, ensure_ascii=False)}"
+        except Exception:
+            msg += f" | {resp.text[:300]}"
+        return requests.HTTPError(msg, response=resp)
+
     # auth & accounts
     def login(self, address: str, password: str) -> Dict[str, Any]:
         payload = {"address": address, "password": password}
@@ -141,12 +402,36 @@ class MailTMClient:
         token = data.get("token")
         if not token:
             raise RuntimeError("Login failed: no token in response.")
+        self.use_token(token)
+        self._account_id = data.get("id") or self._account_id
+        self._me_cache = data if ACCOUNT_FIELDS.issubset(data) else None
+        return data
+
+    def use_token(self, token: str) -> None:
+        # Authenticate with an existing bearer token, e.g. one cached from an earlier login
         self._token = token
-        self._session.headers.update(self._auth_headers())
+        self._session.headers["Authorization"] = f"Bearer {token}"
+        self._account_id = _jwt_claims(token).get("id")
+        self._me_cache = None
+
+    @property
+    def token(self) -> Optional[str]:
+        return self._token
+
+    def me(self, force: bool = False) -> Dict[str, Any]:
+        if self._me_cache is not None and not force:
+            return self._me_cache
+        data = self._request("GET", "/me", auth=True)
+        if isinstance(data, dict):
+            self._me_cache = data
+            self._account_id = data.get("id") or self._account_id
         return data
 
-    def me(self) -> Dict[str, Any]:
-        return self._request("GET", "/me", auth=True)
+    def account_id(self) -> Optional[str]:
+        # Known from the login response or token in most cases; /me is the fallback
+        if self._account_id:
+            return self._account_id
+        return self.me().get("id")
 
     def get_account(self, account_id: str) -> Dict[str, Any]:
         return self._request("GET", f"/accounts/{account_id}", auth=True)
@@ -157,11 +442,23 @@ class MailTMClient:
 
     def delete_account(self, account_id: str) -> None:
         self._request("DELETE", f"/accounts/{account_id}", auth=True)
+        if account_id == self._account_id:
+            self._me_cache = None
 
     # domains
     def list_domains(self, page: int = 1) -> Dict[str, Any]:
-        coll = self._request("GET", f"/domains?page={page}")
-        return _normalize_collection(coll)
+        # Only the first page is cached; it is what pick_domain() reads
+        if page == 1 and self._domains_cache is not None:
+            ts, cached = self._domains_cache
+            if time.monotonic() - ts < DOMAINS_TTL:
+                return cached
+        coll = _normalize_collection(self._request("GET", f"/domains?page={page}"))
+        if page == 1:
+            self._domains_cache = (time.monotonic(), coll)
+        return coll
+
+    def invalidate_domains(self) -> None:
+        self._domains_cache = None
 
     def get_domain(self, domain_id: str) -> Dict[str, Any]:
         return self._request("GET", f"/domains/{domain_id}")
@@ -181,6 +478,25 @@ class MailTMClient:
         coll = self._request("GET", f"/messages?page={page}", auth=True)
         return _normalize_collection(coll)
 
+    def list_messages_lite(self, page: int = 1) -> Dict[str, Any]:
+        # Streams the page with ijson and keeps only LIST_FIELDS per message;
+        # without ijson this is the same as list_messages()
+        if ijson is None:
+            return self.list_messages(page=page)
+        self._require_auth()
+        path = f"/messages?page={page}"
+        with self._session.get(self._url(path), stream=True, timeout=self.timeout) as resp:
+            if not resp.ok:
+                raise self._http_error("GET", path, resp)
+            # Mirror _request: non-JSON or unparsable bodies become an empty collection
+            if resp.status_code == 204 or not resp.headers.get("Content-Type", "").startswith(_JSON_CTYPES):
+                return _normalize_collection(None)
+            resp.raw.decode_content = True
+            try:
+                return _project_collection(ijson.parse(resp.raw), LIST_FIELDS)
+            except ijson.JSONError:
+                return _normalize_collection(None)
+
     def get_message(self, msg_id: str) -> Dict[str, Any]:
         return self._request("GET", f"/messages/{msg_id}", auth=True)
 
@@ -192,43 +508,74 @@ class MailTMClient:
         return self._request("PATCH", f"/messages/{msg_id}", json=payload, auth=True)
 
     def get_message_source(self, msg_id: str) -> bytes:
+        buf = io.BytesIO()
+        self.save_source_to(msg_id, buf)
+        return buf.getvalue()
+
+    def save_source_to(self, msg_id: str, fp) -> None:
         # Prefer documented /sources/{id} endpoint; keep backward-compatible fallback
+        self._require_auth()
         src_url = self._url(f"/sources/{msg_id}")
-        r = self._session.get(src_url, headers=self._auth_headers(), timeout=self.timeout)
-        if r.ok:
-            # API returns JSON with 'data' base64 or raw string; but also supports downloadUrl
-            ctype = r.headers.get("Content-Type", "")
-            if "application/json" in ctype or "application/ld+json" in ctype:
-                try:
-                    data = r.json()
-                    payload = data.get("data")
-                    if isinstance(payload, str):
-                        return payload.encode("utf-8", errors="ignore")
-                except Exception:
-                    pass
-            return r.content
-        # Fallback legacy path
+        with self._session.get(src_url, stream=True, timeout=self.timeout) as r:
+            if r.ok:
+                # A JSON envelope has to be parsed whole; raw sources are streamed
+                src = self._source_from_json(r)
+                if src is not None:
+                    fp.write(src)
+                else:
+                    self._copy_stream(r, fp)
+                return
+            status = r.status_code
         legacy_url = self._url(f"/messages/{msg_id}/source")
-        r2 = self._session.get(legacy_url, headers=self._auth_headers(), timeout=self.timeout)
-        if not r2.ok:
-            raise requests.HTTPError(
-                f"GET /sources/{msg_id} -> {r.status_code}; fallback /messages/{msg_id}/source -> {r2.status_code} | {r2.text[:200]}"
-            )
-        return r2.content
+        with self._session.get(legacy_url, stream=True, timeout=self.timeout) as r2:
+            if not r2.ok:
+                raise requests.HTTPError(
+                    f"GET /sources/{msg_id} -> {status}; fallback /messages/{msg_id}/source -> {r2.status_code} | {r2.text[:200]}",
+                    response=r2,
+                )
+            self._copy_stream(r2, fp)
+
+    @staticmethod
+    def _source_from_json(r):
+        # API returns JSON with 'data' base64 or raw string; but also supports downloadUrl
+        ctype = r.headers.get("Content-Type", "")
+        if ctype.startswith(_JSON_CTYPES):
+            try:
+                data = _loads(r.content)
+                payload = data.get("data")
+                if isinstance(payload, str):
+                    return _decode_source(payload)
+            except Exception:
+                pass
+            return r.content
+        return None
+
+    @staticmethod
+    def _copy_stream(r, fp) -> None:
+        # iter_content (unlike r.raw) undoes any Content-Encoding
+        for chunk in r.iter_content(chunk_size=STREAM_CHUNK):
+            fp.write(chunk)
 
     def list_attachments(self, msg: Dict[str, Any]) -> List[Dict[str, Any]]:
         return [a for a in (msg.get("attachments") or []) if isinstance(a, dict)]
 
     def download_attachment(self, msg_id: str, attachment_id: str) -> bytes:
+        buf = io.BytesIO()
+        self.download_attachment_to(msg_id, attachment_id, buf)
+        return buf.getvalue()
+
+    def download_attachment_to(self, msg_id: str, attachment_id: str, fp) -> None:
         # Try documented approach via message details' downloadUrl first when available
         # If not available, fall back to legacy path
+        self._require_auth()
         url = self._url(f"/messages/{msg_id}/attachments/{attachment_id}")
-        r = self._session.get(url, headers=self._auth_headers(), timeout=self.timeout)
-        if not r.ok:
-            raise requests.HTTPError(
-                f"GET /messages/{msg_id}/attachments/{attachment_id} -> {r.status_code} | {r.text[:200]}"
-            )
-        return r.content
+        with self._session.get(url, stream=True, timeout=self.timeout) as r:
+            if not r.ok:
+                raise requests.HTTPError(
+                    f"GET /messages/{msg_id}/attachments/{attachment_id} -> {r.status_code} | {r.text[:200]}",
+                    response=r,
+                )
+            self._copy_stream(r, fp)
 
 
 # --------------------------
@@ -264,13 +611,15 @@ def print_domains(coll):
 
 
 def print_list(coll):
+    # Lines are collected and written once to keep large inboxes to a single write
     items = _sort_desc_by_created(coll.get("hydra:member", []))
     total = coll.get("hydra:totalItems", len(items))
-    print(f"Inbox (showing {len(items)} of ~{total})")
-    print("--------------------------------------------------------------")
+    buf = [
+        f"Inbox (showing {len(items)} of ~{total})\n",
+        "--------------------------------------------------------------\n",
+    ]
     if not items:
-        print("(empty)")
-        return
+        buf.append("(empty)\n")
     for it in items:
         created = it.get("createdAt")
         subj = it.get("subject") or "(no subject)"
@@ -278,58 +627,143 @@ def print_list(coll):
         intro = it.get("intro") or ""
         seen = "✓" if it.get("seen") else " "
         frm_str = _format_address(it.get("from"))
-        print(f"[{seen}] {created}  {subj}")
-        print(f"      From: {frm_str}")
-        print(f"      ID:   {mid}")
+        buf.append(f"[{seen}] {created}  {subj}\n")
+        buf.append(f"      From: {frm_str}\n")
+        buf.append(f"      ID:   {mid}\n")
         if intro:
-            print(f"      Intro: {intro[:120].replace('\\n',' ')}{'…' if len(intro) > 120 else ''}")
-        print()
+            short = intro[:120].replace("\n", " ")
+            buf.append(f"      Intro: {short}{'…' if len(intro) > 120 else ''}\n")
+        buf.append("\n")
+    sys.stdout.write("".join(buf))
 
 
-def print_message(full):
-    print("Message")
-    print("-------")
-    print(f"ID:       {full.get('id')}")
-    print(f"Date:     {full.get('createdAt')}")
-    print(f"From:     {_format_address(full.get('from'))}")
-    tos_raw = full.get("to") or full.get("recipients")
-    print(f"To:       {_format_address_list(tos_raw)}")
-    print(f"Subject:  {full.get('subject') or '(no subject)'}")
-    print(f"Seen:     {full.get('seen')}")
-    print(f"Size:     {full.get('size')}")
-    print(f"HasAtts:  {full.get('hasAttachments')}")
-    print()
+def _append_body(buf, full):
     body_text = full.get("text")
     if isinstance(body_text, str) and body_text.strip():
-        print("Text Body")
-        print("---------")
-        print(body_text.strip())
-        print()
+        buf.append("Text Body\n---------\n")
+        buf.append(f"{body_text.strip()}\n\n")
+        return
+    html_parts = full.get("html") or []
+    simplified = _simplify_html(html_parts) if html_parts else ""
+    if simplified:
+        buf.append("HTML Body (simplified)\n----------------------\n")
+        buf.append(f"{simplified}\n\n")
     else:
-        html_parts = full.get("html") or []
-        if html_parts:
-            simplified = _simplify_html(html_parts)
-            if simplified:
-                print("HTML Body (simplified)")
-                print("----------------------")
-                print(simplified)
-                print()
-            else:
-                print("(No body content)")
-        else:
-            print("(No body content)")
+        buf.append("(No body content)\n")
+
+
+def print_message(full, body=True):
+    tos_raw = full.get("to") or full.get("recipients")
+    buf = [
+        "Message\n",
+        "-------\n",
+        f"ID:       {full.get('id')}\n",
+        f"Date:     {full.get('createdAt')}\n",
+        f"From:     {_format_address(full.get('from'))}\n",
+        f"To:       {_format_address_list(tos_raw)}\n",
+        f"Subject:  {full.get('subject') or '(no subject)'}\n",
+        f"Seen:     {full.get('seen')}\n",
+        f"Size:     {full.get('size')}\n",
+        f"HasAtts:  {full.get('hasAttachments')}\n",
+        "\n",
+    ]
+    if body:
+        _append_body(buf, full)
     if full.get("hasAttachments"):
         for a in full.get("attachments") or []:
             if isinstance(a, dict):
-                print(f"- id={a.get('id')}  name={a.get('filename')}  type={a.get('contentType')}  size={a.get('size')}")
-    print()
+                buf.append(f"- id={a.get('id')}  name={a.get('filename')}  type={a.get('contentType')}  size={a.get('size')}\n")
+    buf.append("\n")
+    sys.stdout.write("".join(buf))
 
 
 # --------------------------
 # CLI
 # --------------------------
 
-def build_parser():
+def _add_creds(p):
+    p.add_argument("--email", required=True)
+    p.add_argument("--password", required=True)
+
+
+def _add_id_creds(p):
+    p.add_argument("id")
+    _add_creds(p)
+
+
+def _add_acc_create(p):
+    p.add_argument("--password", required=True)
+    p.add_argument("--local")
+    p.add_argument("--domain")
+    p.add_argument("--random", action="store_true")
+    p.add_argument("--print-login", action="store_true")
+
+
+def _add_domains(p):
+    p.add_argument("--page", type=int, default=1)
+
+
+def _add_domain(p):
+    p.add_argument("id")
+
+
+def _add_msg_list(p):
+    _add_creds(p)
+    p.add_argument("--page", type=int, default=1)
+
+
+def _add_msg_read(p):
+    _add_id_creds(p)
+    p.add_argument("--mark-seen", action="store_true")
+
+
+def _add_msg_latest(p):
+    _add_creds(p)
+    p.add_argument("--mark-seen", action="store_true")
+    p.add_argument("--no-body", action="store_true", help="Print headers from the list entry only")
+
+
+def _add_msg_save_source(p):
+    p.add_argument("id")
+    p.add_argument("--out", required=True)
+    _add_creds(p)
+
+
+def _add_msg_save_atts(p):
+    p.add_argument("id")
+    p.add_argument("--dir", required=True)
+    _add_creds(p)
+
+
+_ACCOUNT_CMDS = {
+    "create": ("Create account", _add_acc_create),
+    "me": ("Show /me", _add_creds),
+    "get": ("Get account by id", _add_id_creds),
+    "delete": ("Delete account", _add_creds),
+    "delete-id": ("Delete account by id", _add_id_creds),
+}
+
+_MESSAGE_CMDS = {
+    "list": ("List messages", _add_msg_list),
+    "read": ("Read message", _add_msg_read),
+    "latest": ("Read newest message", _add_msg_latest),
+    "delete": ("Delete message", _add_id_creds),
+    "mark-seen": ("Mark seen", _add_id_creds),
+    "save-source": ("Save raw .eml", _add_msg_save_source),
+    "save-atts": ("Download attachments", _add_msg_save_atts),
+}
+
+# name -> (help, args builder) or (help, (dest, nested table))
+_COMMANDS = {
+    "login": ("Authenticate and print /me", _add_creds),
+    "account": ("Account operations", ("acc_cmd", _ACCOUNT_CMDS)),
+    "domains": ("List available domains", _add_domains),
+    "domain": ("Get domain by id", _add_domain),
+    "messages": ("Message operations", ("msg_cmd", _MESSAGE_CMDS)),
+}
+
+
+def build_parser(argv=None):
     app_desc = (
         "Mail.tm CLI\n"
         "\n"
@@ -354,93 +788,33 @@ def build_parser():
         "  mailtm.py messages list --email you@domain --password 'pw' --page 1\n"
         "  mailtm.py messages read <MSG_ID> --email you@domain --password 'pw' --mark-seen\n"
         "  mailtm.py messages latest --email you@domain --password 'pw' --mark-seen\n"
+        "  mailtm.py messages latest --email you@domain --password 'pw' --mark-seen --no-body\n"
         "  mailtm.py messages delete <MSG_ID> --email you@domain --password 'pw'\n"
         "  mailtm.py messages mark-seen <MSG_ID> --email you@domain --password 'pw'\n"
         "  mailtm.py messages save-source <MSG_ID> --out msg.eml --email you@domain --password 'pw'\n"
         "  mailtm.py messages save-atts <MSG_ID> --dir ./downloads --email you@domain --password 'pw'\n"
     )
+    # Peek at the command words so only the parsers needed for this run get built.
+    # Anything unrecognised (e.g. -h, typos) falls back to the full tree.
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = argv[0] if argv and argv[0] in _COMMANDS else None
+    sub_cmd = argv[1] if cmd and len(argv) > 1 else None
+
     p = argparse.ArgumentParser(description=app_desc, formatter_class=argparse.RawTextHelpFormatter)
     sub = p.add_subparsers(dest="cmd", required=True)
-
-    sp_login = sub.add_parser("login", help="Authenticate and print /me")
-    sp_login.add_argument("--email", required=True)
-    sp_login.add_argument("--password", required=True)
-
-    sp_acc = sub.add_parser("account", help="Account operations")
-    acc_sub = sp_acc.add_subparsers(dest="acc_cmd", required=True)
-
-    sp_acc_create = acc_sub.add_parser("create", help="Create account")
-    sp_acc_create.add_argument("--password", required=True)
-    sp_acc_create.add_argument("--local")
-    sp_acc_create.add_argument("--domain")
-    sp_acc_create.add_argument("--random", action="store_true")
-    sp_acc_create.add_argument("--print-login", action="store_true")
-
-    sp_acc_me = acc_sub.add_parser("me", help="Show /me")
-    sp_acc_me.add_argument("--email", required=True)
-    sp_acc_me.add_argument("--password", required=True)
-
-    sp_acc_get = acc_sub.add_parser("get", help="Get account by id")
-    sp_acc_get.add_argument("id")
-    sp_acc_get.add_argument("--email", required=True)
-    sp_acc_get.add_argument("--password", required=True)
-
-    sp_acc_delete = acc_sub.add_parser("delete", help="Delete account")
-    sp_acc_delete.add_argument("--email", required=True)
-    sp_acc_delete.add_argument("--password", required=True)
-
-    sp_acc_delete_id = acc_sub.add_parser("delete-id", help="Delete account by id")
-    sp_acc_delete_id.add_argument("id")
-    sp_acc_delete_id.add_argument("--email", required=True)
-    sp_acc_delete_id.add_argument("--password", required=True)
-
-    sp_dom = sub.add_parser("domains", help="List available domains")
-    sp_dom.add_argument("--page", type=int, default=1)
-
-    sp_dom_get = sub.add_parser("domain", help="Get domain by id")
-    sp_dom_get.add_argument("id")
-
-    sp_msg = sub.add_parser("messages", help="Message operations")
-    msg_sub = sp_msg.add_subparsers(dest="msg_cmd", required=True)
-
-    sp_msg_list = msg_sub.add_parser("list", help="List messages")
-    sp_msg_list.add_argument("--email", required=True)
-    sp_msg_list.add_argument("--password", required=True)
-    sp_msg_list.add_argument("--page", type=int, default=1)
-
-    sp_msg_read = msg_sub.add_parser("read", help="Read message")
-    sp_msg_read.add_argument("id")
-    sp_msg_read.add_argument("--email", required=True)
-    sp_msg_read.add_argument("--password", required=True)
-    sp_msg_read.add_argument("--mark-seen", action="store_true")
-
-    sp_msg_latest = msg_sub.add_parser("latest", help="Read newest message")
-    sp_msg_latest.add_argument("--email", required=True)
-    sp_msg_latest.add_argument("--password", required=True)
-    sp_msg_latest.add_argument("--mark-seen", action="store_true")
-
-    sp_msg_delete = msg_sub.add_parser("delete", help="Delete message")
-    sp_msg_delete.add_argument("id")
-    sp_msg_delete.add_argument("--email", required=True)
-    sp_msg_delete.add_argument("--password", required=True)
-
-    sp_msg_seen = msg_sub.add_parser("mark-seen", help="Mark seen")
-    sp_msg_seen.add_argument("id")
-    sp_msg_seen.add_argument("--email", required=True)
-    sp_msg_seen.add_argument("--password", required=True)
-
-    sp_msg_src = msg_sub.add_parser("save-source", help="Save raw .eml")
-    sp_msg_src.add_argument("id")
-    sp_msg_src.add_argument("--out", required=True)
-    sp_msg_src.add_argument("--email", required=True)
-    sp_msg_src.add_argument("--password", required=True)
-
-    sp_msg_atts = msg_sub.add_parser("save-atts", help="Download attachments")
-    sp_msg_atts.add_argument("id")
-    sp_msg_atts.add_argument("--dir", required=True)
-    sp_msg_atts.add_argument("--email", required=True)
-    sp_msg_atts.add_argument("--password", required=True)
-
+    for name, (help_text, spec) in _COMMANDS.items():
+        if cmd not in (None, name):
+            continue
+        sp = sub.add_parser(name, help=help_text)
+        if callable(spec):
+            spec(sp)
+            continue
+        dest, table = spec
+        group = sp.add_subparsers(dest=dest, required=True)
+        sel = sub_cmd if sub_cmd in table else None
+        for leaf, (leaf_help, add_args) in table.items():
+            if sel in (None, leaf):
+                add_args(group.add_parser(leaf, help=leaf_help))
     return p
 
 
@@ -448,13 +822,49 @@ def build_parser():
 # Main
 # --------------------------
 
+def _mark_seen_merged(client, msg_id, msg) -> Dict[str, Any]:
+    # Marks msg seen unless it already is. The PATCH reply may be partial (e.g. just
+    # {"seen": true}), so it is overlaid on the message we have instead of re-fetching
+    if msg.get("seen"):
+        return msg
+    updated = client.mark_seen(msg_id)
+    return {**msg, "seen": True, **(updated if isinstance(updated, dict) else {})}
+
+
+def _login(client, email, password, use_cache=True) -> bool:
+    # Returns True when a cached token was used instead of POST /token
+    token = _load_token(email) if use_cache else None
+    if token:
+        client.use_token(token)
+        return True
+    client.login(email, password)
+    _save_token(email, client.token)
+    return False
+
+
 def main(argv=None):
-    parser = build_parser()
+    parser = build_parser(argv)
     args = parser.parse_args(argv)
     client = MailTMClient()
 
+    # Commands taking --email/--password authenticate up front; `login` always hits /token
+    email = getattr(args, "email", None) if args.cmd != "login" else None
+    cached = bool(email) and _login(client, email, args.password)
+    try:
+        _run(client, args)
+    except requests.HTTPError as e:
+        if not cached or e.response is None or e.response.status_code != 401:
+            raise
+        # The cached token was rejected; log in fresh and retry once
+        _drop_token(email)
+        _login(client, email, args.password, use_cache=False)
+        _run(client, args)
+
+
+def _run(client, args):
     if args.cmd == "login":
         client.login(args.email, args.password)
+        _save_token(args.email, client.token)
         print_account_info(client.me())
         return
 
@@ -468,32 +878,34 @@ def main(argv=None):
             address = f"{local}@{domain}"
             acct = client.create_account(address, args.password)
             print("Account created")
-            print(json.dumps(acct, indent=2, ensure_ascii=False))
+            print(_dumps(acct))
             if args.print_login:
                 client.login(address, args.password)
+                _save_token(address, client.token)
                 print_account_info(client.me())
             return
         if args.acc_cmd == "me":
-            client.login(args.email, args.password)
             print_account_info(client.me())
             return
         if args.acc_cmd == "get":
-            client.login(args.email, args.password)
             data = client.get_account(args.id)
-            print(json.dumps(data, indent=2, ensure_ascii=False))
+            print(_dumps(data))
             return
         if args.acc_cmd == "delete":
-            client.login(args.email, args.password)
-            acc_id = client.me().get("id")
+            acc_id = client.account_id()
             if not acc_id:
-                print("Cannot determine account id from /me")
+                print("Cannot determine account id from login or /me")
                 sys.exit(3)
             client.delete_account(acc_id)
+            _drop_token(args.email)
             print("Account deleted.")
             return
         if args.acc_cmd == "delete-id":
-            client.login(args.email, args.password)
+            # Resolved before deleting; /me no longer works once our own account is gone
+            own = args.id == client.account_id()
             client.delete_account(args.id)
+            if own:
+                _drop_token(args.email)
             print("Account deleted.")
             return
 
@@ -503,32 +915,34 @@ def main(argv=None):
 
     if args.cmd == "domain":
         data = client.get_domain(args.id)
-        print(json.dumps(data, indent=2, ensure_ascii=False))
+        print(_dumps(data))
         return
 
     if args.cmd == "messages":
-        client.login(args.email, args.password)
         if args.msg_cmd == "list":
-            print_list(client.list_messages(page=args.page))
+            print_list(client.list_messages_lite(page=args.page))
             return
         if args.msg_cmd == "read":
             msg = client.get_message(args.id)
-            if args.mark_seen and not msg.get("seen"):
-                client.mark_seen(args.id)
-                msg = client.get_message(args.id)
+            if args.mark_seen:
+                msg = _mark_seen_merged(client, args.id, msg)
             print_message(msg)
             return
         if args.msg_cmd == "latest":
-            items = _sort_desc_by_created(client.list_messages(page=1).get("hydra:member", []))
-            if not items:
+            latest = _latest_by_created(client.list_messages(page=1).get("hydra:member", []))
+            if latest is None:
                 print("(inbox empty)")
                 return
-            latest = items[0]
             mid = latest.get("id")
+            if args.no_body:
+                # The list entry already carries the headers; skip GET /messages/{id}
+                if args.mark_seen:
+                    latest = _mark_seen_merged(client, mid, latest)
+                print_message(latest, body=False)
+                return
             msg = client.get_message(mid)
-            if args.mark_seen and not msg.get("seen"):
-                client.mark_seen(mid)
-                msg = client.get_message(mid)
+            if args.mark_seen:
+                msg = _mark_seen_merged(client, mid, msg)
             print_message(msg)
             return
         if args.msg_cmd == "delete":
@@ -540,9 +954,7 @@ def main(argv=None):
             print("Message marked seen.")
             return
         if args.msg_cmd == "save-source":
-            data = client.get_message_source(args.id)
-            with open(args.out, "wb") as f:
-                f.write(data)
+            _write_file_atomic(args.out, lambda f: client.save_source_to(args.id, f))
             print(f"Saved EML to {args.out}")
             return
         if args.msg_cmd == "save-atts":
@@ -553,15 +965,23 @@ def main(argv=None):
                 return
             os.makedirs(args.dir, exist_ok=True)
             count = 0
-            for a in atts:
-                att_id = a.get("id")
-                fname = a.get("filename") or f"att_{att_id or count}"
-                blob = client.download_attachment(args.id, att_id)
-                path = os.path.join(args.dir, fname)
-                with open(path, "wb") as f:
-                    f.write(blob)
-                print(f"Saved {fname} ({a.get('contentType')}, {a.get('size')} bytes)")
-                count += 1
+
+            def _save(att_id, path):
+                _write_file_atomic(path, lambda f: client.download_attachment_to(args.id, att_id, f))
+
+            # Downloads overlap on the shared session; each worker streams into its own file
+            with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(atts))) as ex:
+                fnames = _dedupe_filenames(
+                    [a.get("filename") or f"att_{a.get('id') or idx}" for idx, a in enumerate(atts)]
+                )
+                futs = {}
+                for fname, a in zip(fnames, atts):
+                    futs[ex.submit(_save, a.get("id"), os.path.join(args.dir, fname))] = (fname, a)
+                for fut in as_completed(futs):
+                    fname, a = futs[fut]
+                    fut.result()
+                    print(f"Saved {fname} ({a.get('contentType')}, {a.get('size')} bytes)")
+                    count += 1
             print(f"Saved {count} attachment(s) to {args.dir}")
             return
 